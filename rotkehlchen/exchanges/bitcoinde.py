@@ -1,29 +1,30 @@
 import hashlib
 import hmac
 import logging
+import threading
 import time
+from datetime import datetime
+from functools import lru_cache, partial
 from json.decoder import JSONDecodeError
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
 from urllib.parse import urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
 from typing_extensions import Literal
 
 from rotkehlchen.assets.asset import Asset
+from rotkehlchen.constants.assets import A_EUR
 from rotkehlchen.errors import RemoteError
 from rotkehlchen.exchanges.data_structures import Location, Price, Trade, TradePair
 from rotkehlchen.exchanges.exchange import ExchangeInterface
 from rotkehlchen.inquirer import Inquirer
 from rotkehlchen.logging import RotkehlchenLogsAdapter
-from rotkehlchen.serialization.deserialize import (
-    deserialize_fee,
-    deserialize_timestamp_from_date,
-    deserialize_trade_type,
-)
+from rotkehlchen.serialization.deserialize import deserialize_fee, deserialize_trade_type
 from rotkehlchen.typing import ApiKey, ApiSecret, AssetAmount, FVal, Timestamp
 from rotkehlchen.user_messages import MessagesAggregator
 from rotkehlchen.utils.misc import iso8601ts_to_timestamp
-from rotkehlchen.utils.serialization import rlk_jsonloads
+from rotkehlchen.utils.serialization import rlk_orjsonloads
 
 if TYPE_CHECKING:
     from rotkehlchen.db.dbhandler import DBHandler
@@ -45,7 +46,9 @@ BITCOINDE_TRADING_PAIRS = (
 )
 
 
+@lru_cache(maxsize=256)
 def bitcoinde_asset(asset: str) -> Asset:
+    """Turns a bitcoin.de ticker to a rotki Asset, caching the registry lookup"""
     return Asset(asset.upper())
 
 
@@ -55,31 +58,96 @@ def bitcoinde_pair_to_world(pair: str) -> Tuple[Asset, Asset]:
     return tx_asset, native_asset
 
 
-def trade_from_bitcoinde(raw_trade: Dict) -> Trade:
+def _make_pair_entry(pair: str) -> Tuple[Asset, Asset, TradePair]:
+    tx_asset, native_asset = bitcoinde_pair_to_world(pair)
+    return tx_asset, native_asset, TradePair(
+        f'{tx_asset.identifier}_{native_asset.identifier}',
+    )
+
+
+# The pair universe is tiny, so resolve the assets and the TradePair string of
+# each known pair once at import instead of rebuilding them per trade
+_BITCOINDE_PAIR_CACHE: Dict[str, Tuple[Asset, Asset, TradePair]] = {
+    pair: _make_pair_entry(pair) for pair in BITCOINDE_TRADING_PAIRS
+}
+
+
+def _bitcoinde_sign(
+        hmac_template: 'hmac.HMAC',
+        sig_tail: bytes,
+        sig_suffix: bytes,
+        request_type: str,
+        url: str,
+        nonce: str,
+) -> str:
+    """Signing specialized on the per-session constants
+
+    Bitcoinde.__init__ binds the first three arguments with
+    functools.partial, leaving a call that works purely on its arguments
+    without any self attribute lookups.
+    """
+    mac = hmac_template.copy()
+    mac.update(
+        request_type.encode() + b'#' + url.encode() +
+        sig_tail + nonce.encode() + sig_suffix,
+    )
+    return mac.hexdigest()
+
+
+# Bitcoin.de timestamps follow a fixed 'YYYY-MM-DDTHH:MM:SS+HH:MM' schema
+_ISO_FMT = '%Y-%m-%dT%H:%M:%S%z'
+
+
+def _fast_iso(datestr: str) -> Timestamp:
+    """Parses bitcoin.de's fixed-schema ISO8601 timestamps with strptime
 
+    A single fixed-format parse is considerably cheaper than the generic
+    iso8601 handling, which any deviating value still falls back to.
+    """
     try:
-        timestamp = deserialize_timestamp_from_date(
-            raw_trade['successfully_finished_at'],
-            'iso8601',
-            'bitcoinde',
-        )
+        return Timestamp(int(datetime.strptime(datestr, _ISO_FMT).timestamp()))
+    except (ValueError, TypeError):
+        return iso8601ts_to_timestamp(datestr)
+
+
+@lru_cache(maxsize=4096)
+def _calculate_rate(native_amount: str, tx_amount: str) -> Price:
+    """Rate from string amounts. Full histories repeat many (volume, amount)
+    pairs, so caching collapses the repeated Decimal divisions. Strings are
+    used as keys since FVal is not hashable."""
+    return Price(FVal(native_amount) / FVal(tx_amount))
+
+
+def _tx_timestamp(tx: Dict) -> Timestamp:
+    try:
+        return _fast_iso(tx['successfully_finished_at'])
     except KeyError:
         # For very old trades (2013) bitcoin.de does not return 'successfully_finished_at'
-        timestamp = deserialize_timestamp_from_date(
-            raw_trade['trade_marked_as_paid_at'],
-            'iso8601',
-            'bitcoinde',
-        )
+        return _fast_iso(tx['trade_marked_as_paid_at'])
+
+
+def trade_from_bitcoinde(raw_trade: Dict, timestamp: Optional[Timestamp] = None) -> Trade:
+    """Turns a raw bitcoin.de trade entry to a Trade
 
+    Callers that have already parsed the entry's timestamp (e.g. for window
+    filtering) can pass it in to avoid a second parse.
+    """
+    if timestamp is None:
+        timestamp = _tx_timestamp(raw_trade)
     trade_type = deserialize_trade_type(raw_trade['type'])
     tx_amount = AssetAmount(FVal(raw_trade['amount_currency_to_trade']))
     native_amount = FVal(raw_trade['volume_currency_to_pay'])
-    tx_asset, native_asset = bitcoinde_pair_to_world(raw_trade['trading_pair'])
-    pair = TradePair(f'{tx_asset.identifier}_{native_asset.identifier}')
+    try:
+        tx_asset, native_asset, pair = _BITCOINDE_PAIR_CACHE[raw_trade['trading_pair']]
+    except KeyError:
+        # Should not happen with the known pair universe but don't break on
+        # a pair the cache does not know about
+        tx_asset, native_asset = bitcoinde_pair_to_world(raw_trade['trading_pair'])
+        pair = TradePair(f'{tx_asset.identifier}_{native_asset.identifier}')
     amount = tx_amount
-    rate = Price(native_amount / tx_amount)
+    rate = _calculate_rate(str(native_amount), str(tx_amount))
     fee_amount = deserialize_fee(raw_trade['fee_currency_to_pay'])
-    fee_asset = Asset('EUR')
+    fee_asset = A_EUR
 
     return Trade(
         timestamp=timestamp,
@@ -104,73 +172,101 @@ class Bitcoinde(ExchangeInterface):
     ):
         super().__init__('bitcoinde', api_key, secret, database)
         self.uri = 'https://api.bitcoin.de'
+        # Keep the TCP+TLS connections warm across the bursty pagination
+        # loops. No status-based retries here: urllib3 would resend the
+        # byte-identical request and bitcoin.de rejects a reused nonce, so a
+        # retry could never succeed anyway.
+        self.session.mount(self.uri, HTTPAdapter(pool_connections=4, pool_maxsize=8))
         self.session.headers.update({'x-api-key': api_key})
         self.msg_aggregator = msg_aggregator
+        # The secret does not change during the session, so bind the keyed
+        # HMAC state (precomputed once, only copy()ed per request) and the
+        # static parts of the '#'-joined signature payload into the signing
+        # function up front
+        self._sign = partial(
+            _bitcoinde_sign,
+            hmac.new(self.secret, digestmod='sha256'),
+            b'#' + api_key.encode() + b'#',
+            b'#' + MD5_EMPTY_STR.encode(),
+        )
+        # Guards nonce generation + signing so concurrent pagination threads
+        # do not end up with identical nonces
+        self._sign_lock = threading.Lock()
+        self._last_nonce = 0
+        log.debug(
+            'Bitcoin.de signature hash backend',
+            sha256_available='sha256' in hashlib.algorithms_available,
+        )
+
+    def _make_nonce(self) -> str:
+        """Returns a strictly increasing millisecond nonce
+
+        time_ns avoids the float round-trip of time.time() * 1000 and the
+        last-nonce counter keeps concurrent calls unique. Must be called with
+        _sign_lock held.
+        """
+        nonce = time.time_ns() // 1_000_000
+        if nonce <= self._last_nonce:
+            nonce = self._last_nonce + 1
+        self._last_nonce = nonce
+        return str(nonce)
 
     def _generate_signature(self, request_type: str, url: str, nonce: str) -> str:
-        signed_data = '#'.join([request_type, url, self.api_key, nonce, MD5_EMPTY_STR]).encode()
-        signature = hmac.new(
-            self.secret,
-            signed_data,
-            hashlib.sha256,
-        ).hexdigest()
-        self.session.headers.update({
-            'x-api-signature': signature,
-        })
-        return signature
+        return self._sign(request_type, url, nonce)
 
     def _api_query(
             self,
             verb: Literal['get', 'post'],
             path: str,
-            options: Optional[Dict] = None,
+            options: Optional[Union[Dict, str]] = None,
     ) -> Dict:
         """
         Queries Bitcoin.de with the given verb for the given path and options
+
+        options can also be given as an already urlencoded query string, which
+        hot paths such as the trade history pagination use to skip urlencode
         """
-        assert verb in ('get', 'post'), (
-            'Given verb {} is not a valid HTTP verb'.format(verb)
-        )
+        send = self.session.get if verb == 'get' else self.session.post
 
         request_path_no_args = '/v4/' + path
 
-        data = ''
         if not options:
             request_path = request_path_no_args
+        elif isinstance(options, str):
+            request_path = request_path_no_args + '?' + options
         else:
             request_path = request_path_no_args + '?' + urlencode(options)
 
-        nonce = str(int(time.time() * 1000))
         request_url = self.uri + request_path
 
-        self._generate_signature(
-            request_type=verb.upper(),
-            url=request_url,
-            nonce=nonce,
-        )
+        log.debug('Bitcoin.de API Query', verb=verb, request_url=request_url)
+
+        with self._sign_lock:
+            nonce = self._make_nonce()
+            signature = self._sign(verb.upper(), request_url, nonce)
 
         headers = {
             'x-api-nonce': nonce,
+            'x-api-signature': signature,
         }
-        if data != '':
-            headers.update({
-                'Content-Type': 'application/json',
-                'Content-Length': str(len(data)),
-            })
-
-        log.debug('Bitcoin.de API Query', verb=verb, request_url=request_url)
 
         try:
-            response = getattr(self.session, verb)(request_url, data=data, headers=headers)
+            response = send(request_url, headers=headers, timeout=30)
         except requests.exceptions.RequestException as e:
             raise RemoteError(f'Bitcoin.de API request failed due to {str(e)}') from e
 
+        if response.status_code == 401:
+            # The error body carries no extra information, so skip parsing it.
+            # This is a common path during api key validation.
+            raise RemoteError('Provided API Key is invalid')
+
         try:
-            json_ret = rlk_jsonloads(response.text)
+            # orjson's JSONDecodeError is a subclass of the stdlib one
+            json_ret = rlk_orjsonloads(response.content)
         except JSONDecodeError as exc:
             raise RemoteError('Bitcoin.de returned invalid JSON response') from exc
 
-        if response.status_code not in (200, 401):
+        if response.status_code != 200:
             if isinstance(json_ret, dict) and 'errors' in json_ret:
                 for error in json_ret['errors']:
                     if error.get('field') == 'X-API-KEY' and error.get('code') == 1:
@@ -241,35 +337,36 @@ class Bitcoinde(ExchangeInterface):
             end_ts: Timestamp,
     ) -> List[Trade]:
 
+        # Bitcoin.de expects the nonce of each request to be larger than the
+        # one it saw last, so the pages cannot be fetched concurrently:
+        # requests issued in nonce order may still arrive out of order and
+        # get rejected. Fetch sequentially and stop once a page's oldest
+        # entry falls before the requested window, since no later page can be
+        # relevant then. Pages entirely newer than the window still have to
+        # be fetched but are not accumulated. Ordering inside a page is not
+        # guaranteed, so the window checks use the min of the batch
+        # timestamps.
+        resp_trades: List[Dict] = []
         page = 1
-        resp_trades = []
-
-        while True:
-            resp = self._api_query('get', 'trades', {'state': 1, 'page': page})
-            resp_trades.extend(resp['trades'])
-
-            if 'page' not in resp:
+        last_page = 1
+        while page <= last_page:
+            resp = self._api_query('get', 'trades', f'state=1&page={page}')
+            if page == 1:
+                last_page = resp['page']['last'] if 'page' in resp else 1
+            batch = resp['trades']
+            timestamps = [_tx_timestamp(tx) for tx in batch]
+            if len(timestamps) != 0 and min(timestamps) > end_ts:
+                page += 1
+                continue  # the whole page is newer than the window
+            resp_trades.extend(batch)
+            if len(timestamps) != 0 and min(timestamps) < start_ts:
                 break
-
-            if resp['page']['current'] >= resp['page']['last']:
-                break
-
-            page = resp['page']['current'] + 1
+            page += 1
 
         log.debug('Bitcoin.de trade history query', results_num=len(resp_trades))
 
-        trades = []
-        for tx in resp_trades:
-            try:
-                timestamp = iso8601ts_to_timestamp(tx['successfully_finished_at'])
-            except KeyError:
-                # For very old trades (2013) bitcoin.de does not return 'successfully_finished_at'
-                timestamp = iso8601ts_to_timestamp(tx['trade_marked_as_paid_at'])
-
-            if tx['state'] != 1:
-                continue
-            if timestamp < start_ts or timestamp > end_ts:
-                continue
-            trades.append(trade_from_bitcoinde(tx))
-
-        return trades
+        return [
+            trade_from_bitcoinde(tx, timestamp=timestamp)
+            for tx, timestamp in ((tx, _tx_timestamp(tx)) for tx in resp_trades)
+            if tx['state'] == 1 and start_ts <= timestamp <= end_ts
+        ]
@@ -2,13 +2,19 @@ import base64
 import hashlib
 import hmac
 import logging
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from json.decoder import JSONDecodeError
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
 from urllib.parse import urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
 from typing_extensions import Literal
+from urllib3.util.retry import Retry
 
 from rotkehlchen.assets.asset import Asset
 from rotkehlchen.errors import RemoteError, UnknownAsset
@@ -16,20 +22,44 @@ from rotkehlchen.exchanges.data_structures import Location, Price, Trade, TradeP
 from rotkehlchen.exchanges.exchange import ExchangeInterface
 from rotkehlchen.inquirer import Inquirer
 from rotkehlchen.logging import RotkehlchenLogsAdapter
-from rotkehlchen.typing import ApiKey, ApiSecret, Timestamp
+from rotkehlchen.typing import ApiKey, ApiSecret, FVal, Timestamp
 from rotkehlchen.user_messages import MessagesAggregator
-from rotkehlchen.utils.serialization import rlk_jsonloads
+from rotkehlchen.utils.serialization import rlk_orjsonloads
 
 if TYPE_CHECKING:
     from rotkehlchen.db.dbhandler import DBHandler
 
 UNSUPPORTED_ICONOMI_ASSETS = ('ICNGS',)
 
+# The activity endpoint does not report the total page count, so the
+# pagination speculatively keeps this many page requests in flight and stops
+# when the first empty page comes back. Pages are independent so the
+# pagination is latency- and not CPU-bound.
+PAGE_PREFETCH = 2
+
 logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
 
+def _iconomi_sign(
+        hmac_template: 'hmac.HMAC',
+        request_type: str,
+        request_path: str,
+        timestamp: str,
+) -> str:
+    """Signing with the keyed HMAC state bound as first argument
+
+    Iconomi.__init__ binds it with functools.partial so each call works
+    purely on its arguments without any self attribute lookups.
+    """
+    mac = hmac_template.copy()
+    mac.update(timestamp.encode() + request_type.upper().encode() + request_path.encode())
+    return base64.b64encode(mac.digest()).decode()
+
+
+@lru_cache(maxsize=256)
 def iconomi_asset(asset: str) -> Asset:
+    """Turns an ICONOMI ticker to a rotki Asset, caching the registry lookup"""
     return Asset(asset.upper())
 
 
@@ -39,28 +69,41 @@ def iconomi_pair_to_world(pair: str) -> Tuple[Asset, Asset]:
     return tx_asset, native_asset
 
 
+@lru_cache(maxsize=256)
+def _trade_pair(tx_identifier: str, native_identifier: str) -> TradePair:
+    """Caches the TradePair strings, since only few distinct pairs occur"""
+    return TradePair(f'{tx_identifier}_{native_identifier}')
+
+
+@lru_cache(maxsize=4096)
+def _calculate_rate(native_amount: str, tx_amount: str) -> Price:
+    """Cached trade rate calculation keyed on the string form of the amounts
+    (FVal is not hashable), avoiding a Decimal division per repeated pair"""
+    return Price(FVal(native_amount) / FVal(tx_amount))
+
+
 def trade_from_iconomi(raw_trade: Dict) -> Trade:
 
     timestamp = raw_trade['timestamp']
 
     if raw_trade['type'] == 'buy_asset':
         trade_type = TradeType.BUY
-        tx_asset = Asset(raw_trade['target_ticker'])
+        tx_asset = iconomi_asset(raw_trade['target_ticker'])
         tx_amount = raw_trade['target_amount']
-        native_asset = Asset(raw_trade['source_ticker'])
+        native_asset = iconomi_asset(raw_trade['source_ticker'])
         native_amount = raw_trade['source_amount']
     elif raw_trade['type'] == 'sell_asset':
         trade_type = TradeType.SELL
-        tx_asset = Asset(raw_trade['source_ticker'])
+        tx_asset = iconomi_asset(raw_trade['source_ticker'])
         tx_amount = raw_trade['source_amount']
         native_amount = raw_trade['target_amount']
-        native_asset = Asset(raw_trade['target_ticker'])
+        native_asset = iconomi_asset(raw_trade['target_ticker'])
 
-    pair = TradePair(f'{tx_asset.identifier}_{native_asset.identifier}')
+    pair = _trade_pair(tx_asset.identifier, native_asset.identifier)
     amount = tx_amount
-    rate = Price(native_amount / tx_amount)
+    rate = _calculate_rate(str(native_amount), str(tx_amount))
     fee_amount = raw_trade['fee_amount']
-    fee_asset = Asset(raw_trade['fee_ticker'])
+    fee_asset = iconomi_asset(raw_trade['fee_ticker'])
 
     return Trade(
         timestamp=timestamp,
@@ -85,75 +128,92 @@ class Iconomi(ExchangeInterface):
     ):
         super().__init__('iconomi', api_key, secret, database)
         self.uri = 'https://api.iconomi.com'
+        # Keep the TCP+TLS connections warm across the bursty pagination
+        # loops and retry transient server errors with backoff
+        self.session.mount(self.uri, HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[500, 502, 503, 504],
+            ),
+        ))
         self.msg_aggregator = msg_aggregator
+        # The secret does not change during the session, so bind the keyed
+        # HMAC state (precomputed once, only copy()ed per request) into the
+        # signing function up front
+        self._sign = partial(_iconomi_sign, hmac.new(self.secret, digestmod='sha512'))
+        # Keeps the signing timestamps unique for concurrent pagination calls
+        self._nonce_lock = threading.Lock()
+        self._last_nonce = 0
+        log.debug(
+            'ICONOMI signature hash backend',
+            sha512_available='sha512' in hashlib.algorithms_available,
+        )
+
+    def _make_timestamp(self) -> str:
+        """Returns a strictly increasing millisecond timestamp for signing
+
+        time_ns avoids the float round-trip of time.time() * 1000 and the
+        last-value counter keeps concurrent calls unique.
+        """
+        with self._nonce_lock:
+            nonce = time.time_ns() // 1_000_000
+            if nonce <= self._last_nonce:
+                nonce = self._last_nonce + 1
+            self._last_nonce = nonce
+            return str(nonce)
 
     def _generate_signature(self, request_type: str, request_path: str, timestamp: str) -> str:
-        signed_data = ''.join([timestamp, request_type.upper(), request_path, '']).encode()
-        signature = hmac.new(
-            self.secret,
-            signed_data,
-            hashlib.sha512,
-        )
-        return base64.b64encode(signature.digest()).decode()
+        return self._sign(request_type, request_path, timestamp)
 
     def _api_query(
             self,
             verb: Literal['get', 'post'],
             path: str,
-            options: Optional[Dict] = None,
+            options: Optional[Union[Dict, str]] = None,
             authenticated: bool = True,
     ) -> Any:
         """
         Queries ICONOMI with the given verb for the given path and options
+
+        options can also be given as an already urlencoded query string, which
+        hot paths such as the trade history pagination use to skip urlencode
         """
-        assert verb in ('get', 'post'), (
-            'Given verb {} is not a valid HTTP verb'.format(verb)
-        )
+        send = self.session.get if verb == 'get' else self.session.post
 
         request_path_no_args = '/v1/' + path
 
-        data = ''
         if not options:
             request_path = request_path_no_args
+        elif isinstance(options, str):
+            request_path = request_path_no_args + '?' + options
         else:
             request_path = request_path_no_args + '?' + urlencode(options)
 
-        timestamp = str(int(time.time() * 1000))
+        timestamp = self._make_timestamp()
         request_url = self.uri + request_path
 
         headers = {}
         if authenticated:
-            signature = self._generate_signature(
-                request_type=verb.upper(),
-                request_path=request_path_no_args,
-                timestamp=timestamp,
-            )
+            signature = self._sign(verb.upper(), request_path_no_args, timestamp)
             headers.update({
                 'ICN-SIGN': signature,
                 'ICN-TIMESTAMP': timestamp,
                 'ICN-API-KEY': self.api_key,
             })
 
-        if data != '':
-            headers.update({
-                'Content-Type': 'application/json',
-                'Content-Length': str(len(data)),
-            })
-
         log.debug('ICONOMI API Query', verb=verb, request_url=request_url)
 
         try:
-            response = getattr(self.session, verb)(
-                request_url,
-                data=data,
-                timeout=30,
-                headers=headers,
-            )
+            response = send(request_url, headers=headers, timeout=30)
         except requests.exceptions.RequestException as e:
             raise RemoteError(f'ICONOMI API request failed due to {str(e)}') from e
 
         try:
-            json_ret = rlk_jsonloads(response.text)
+            # orjson's JSONDecodeError is a subclass of the stdlib one
+            json_ret = rlk_orjsonloads(response.content)
         except JSONDecodeError as exc:
             raise RemoteError('ICONOMI returned invalid JSON response') from exc
 
@@ -240,33 +300,52 @@ class Iconomi(ExchangeInterface):
             end_ts: Timestamp,
     ) -> List[Trade]:
 
-        page = 0
         all_transactions = []
 
-        while True:
-            resp = self._api_query('get', 'user/activity', {"pageNumber": str(page)})
-
-            if len(resp['transactions']) == 0:
-                break
-
-            all_transactions.extend(resp['transactions'])
-            page += 1
+        # Keep PAGE_PREFETCH page requests in flight and consume the
+        # responses in page order until the first empty page
+        with ThreadPoolExecutor(max_workers=PAGE_PREFETCH) as executor:
+            pending = deque(
+                executor.submit(self._api_query, 'get', 'user/activity', f'pageNumber={page}')
+                for page in range(PAGE_PREFETCH)
+            )
+            next_page = PAGE_PREFETCH
+            while pending:
+                resp = pending.popleft().result()
+                batch = resp['transactions']
+                if len(batch) == 0:
+                    break
+
+                all_transactions.extend(batch)
+                # Once a page's oldest entry predates the requested window no
+                # later page can be relevant. Ordering inside a page is not
+                # guaranteed, so look at the minimum; out-of-window rows are
+                # dropped by the filter below.
+                if min(tx['timestamp'] for tx in batch) < start_ts:
+                    break
+
+                pending.append(executor.submit(
+                    self._api_query,
+                    'get',
+                    'user/activity',
+                    f'pageNumber={next_page}',
+                ))
+                next_page += 1
 
         log.debug('ICONOMI trade history query', results_num=len(all_transactions))
 
-        trades = []
-        for tx in all_transactions:
-            timestamp = tx['timestamp']
-            if timestamp < start_ts:
-                continue
-            if timestamp > end_ts:
-                continue
+        candidates = [
+            tx for tx in all_transactions
+            if tx['type'] in ('buy_asset', 'sell_asset') and
+            start_ts <= tx['timestamp'] <= end_ts
+        ]
 
-            if tx['type'] in ('buy_asset', 'sell_asset'):
-                try:
-                    trades.append(trade_from_iconomi(tx))
-                except UnknownAsset:
-                    log.warning(f'Ignoring transaction {tx} because of unsupported asset')
+        trades = []
+        for tx in candidates:
+            try:
+                trades.append(trade_from_iconomi(tx))
+            except UnknownAsset:
+                log.warning(f'Ignoring transaction {tx} because of unsupported asset')
 
         return trades
 
@@ -1,3 +1,4 @@
+import json
 from unittest.mock import patch
 
 from rotkehlchen.assets.asset import Asset
@@ -77,6 +78,74 @@ def test_query_trade_history(function_scope_bitcoinde):
     assert trades[1].fee_currency == A_EUR
 
 
+def test_query_trade_history_pagination(function_scope_bitcoinde):
+    """Test that multi-page trade histories are fetched without losing trades
+    and that pagination stops once a page lies fully before the queried window"""
+    bitcoinde = function_scope_bitcoinde
+
+    def make_trade(trade_id, iso_date):
+        return {
+            'trade_id': trade_id,
+            'trading_pair': 'btceur',
+            'type': 'buy',
+            'amount_currency_to_trade': '10',
+            'volume_currency_to_pay': 2341.21,
+            'fee_currency_to_pay': 1.5214,
+            'successfully_finished_at': iso_date,
+            'state': 1,
+        }
+
+    pages = {
+        1: [
+            make_trade('T1', '2020-01-05T00:00:00+00:00'),
+            make_trade('T2', '2020-01-04T00:00:00+00:00'),
+        ],
+        2: [
+            make_trade('T3', '2020-01-03T00:00:00+00:00'),
+            make_trade('T4', '2020-01-02T00:00:00+00:00'),
+        ],
+        3: [
+            make_trade('T5', '2020-01-01T00:00:00+00:00'),
+        ],
+    }
+    queried_pages = []
+
+    def mock_api_return(url, **kwargs):  # pylint: disable=unused-argument
+        page = int(url.split('page=')[1])
+        queried_pages.append(page)
+        return MockResponse(200, json.dumps({
+            'trades': pages[page],
+            'page': {'current': page, 'last': 3},
+            'errors': [],
+            'credits': 10,
+        }))
+
+    with patch.object(bitcoinde.session, 'get', side_effect=mock_api_return):
+        trades = bitcoinde.query_trade_history(
+            start_ts=1578009600,  # 2020-01-03T00:00:00+00:00
+            end_ts=1578182400,  # 2020-01-05T00:00:00+00:00
+        )
+
+    # page 2's oldest trade predates the window so page 3 is never queried
+    assert queried_pages == [1, 2]
+    assert [trade.link for trade in trades] == ['T1', 'T2', 'T3']
+
+
+def test_validate_api_key(function_scope_bitcoinde):
+    """Test that a 401 response makes validate_api_key fail with the invalid
+    key message without returning the parsed error body as a result"""
+    bitcoinde = function_scope_bitcoinde
+
+    def mock_api_return(url, **kwargs):  # pylint: disable=unused-argument
+        return MockResponse(401, '{"errors":[{"code":3}],"credits":0}')
+
+    with patch.object(bitcoinde.session, 'get', side_effect=mock_api_return):
+        result, msg = bitcoinde.validate_api_key()
+
+    assert result is False
+    assert msg == 'Provided API Key is invalid'
+
+
 def test_bitcoinde_trading_pairs():
     for pair in BITCOINDE_TRADING_PAIRS:
         _ = bitcoinde_pair_to_world(pair)
@@ -85,6 +85,29 @@ def test_query_trade_history(function_scope_iconomi):
     assert trades[1].fee_currency == A_EUR
 
 
+def test_query_trade_history_window_boundary(function_scope_iconomi):
+    """Test that no trades are lost when the queried window ends mid-page
+
+    The transactions of ICONOMI_TRADES_RESPONSE are in ascending timestamp
+    order, so this catches window filtering that assumes a page ordering."""
+    iconomi = function_scope_iconomi
+
+    def mock_api_return(url, **kwargs):  # pylint: disable=unused-argument
+        if 'pageNumber=0' in url:
+            return MockResponse(200, ICONOMI_TRADES_RESPONSE)
+        return MockResponse(200, ICONOMI_TRADES_EMPTY_RESPONSE)
+
+    with patch.object(iconomi.session, 'get', side_effect=mock_api_return):
+        trades = iconomi.query_trade_history(
+            start_ts=0,
+            end_ts=1539713117,
+        )
+
+    assert len(trades) == 1
+    assert trades[0].timestamp == 1539713117
+    assert trades[0].trade_type == TradeType.SELL
+
+
 def test_iconomi_assets_are_known(
         database,
         inquirer,  # pylint: disable=unused-argument
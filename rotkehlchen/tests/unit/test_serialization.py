@@ -15,6 +15,7 @@ from rotkehlchen.utils.serialization import (
     rkl_decode_value,
     rlk_jsondumps,
     rlk_jsonloads,
+    rlk_orjsonloads,
 )
 
 
@@ -40,6 +41,22 @@ def test_rlk_jsonloads():
     }
 
 
+def test_rlk_orjsonloads():
+    """The orjson based loader must apply the same FVal/int coercion
+    that rlk_jsonloads does through its object hook"""
+    data = '{"a": "5.4", "b": "foo", "c": 32.1, "d": 5, "e": [1, "a", "5.1"], "f": "37451082560000003241"}'  # noqa: E501
+    result = rlk_orjsonloads(data.encode())
+    assert result == rlk_jsonloads(data)
+    assert result == {
+        'a': FVal('5.4'),
+        'b': 'foo',
+        'c': FVal('32.1'),
+        'd': 5,
+        'e': [1, 'a', FVal('5.1')],
+        'f': 37451082560000003241,
+    }
+
+
 TEST_DATA = {
     'a': FVal('5.4'),
     'b': 'foo',
@@ -1,6 +1,8 @@
 import json
 from typing import Any, Dict, List, Union
 
+import orjson
+
 from rotkehlchen.assets.asset import Asset
 from rotkehlchen.fval import FVal
 from rotkehlchen.typing import Location, TradeType
@@ -47,6 +49,17 @@ def rlk_jsonloads(data: str) -> Union[Dict, List]:
     return json.loads(data, cls=RKLDecoder)
 
 
+def rlk_orjsonloads(data: bytes) -> Union[Dict, List]:
+    """Like rlk_jsonloads but parses the raw response bytes with orjson
+
+    orjson decodes considerably faster than the stdlib parser and operating on
+    bytes also skips the UTF-8 decode that reading response.text would do.
+    The rkl_decode_value pass afterwards keeps the same FVal/int coercion
+    semantics that RKLDecoder's object hook applies.
+    """
+    return rkl_decode_value(orjson.loads(data))
+
+
 def rlk_jsonloads_dict(data: str) -> Dict[str, Any]:
     value = rlk_jsonloads(data)
     assert isinstance(value, dict)